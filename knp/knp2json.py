@@ -1,7 +1,11 @@
 #!/usr/bin/python3
 # using https://github.com/nkmry/knp2json for reference
 
-import re
+import re, sys, json, pickle, time
+try:
+    from knp.parallel import ordered_bounded_map
+except ImportError:   # ./knp/knp2json.py として直接実行したとき
+    from parallel import ordered_bounded_map
 
 class features(dict):
     def __getitem__(self, key):
@@ -36,7 +40,7 @@ def analyze_knp(knp_tab_output):
         if len(l) < 1 or l[0] in "#E":
             continue
         d = {}
-        f = re.split('>?<?', l)
+        f = re.split('>?<|>', l)
         if l[0] == '*':
             d['features'] = decode_features(f[1:-1], d)  # 最初は係り受けの情報、最後は空
             d['relation'] = int(f[0][2:-2])
@@ -136,3 +140,103 @@ def convert_dictionary_to_string(dictionary, keys):
     s += '}'
     return s
 
+
+# featuresをただのdictに置き換える（pickleした結果をこのモジュールなしで読めるように）
+def to_plain(analyzed_knp_info):
+    for d in analyzed_knp_info['phrases'] + analyzed_knp_info['basics']:
+        d['features'] = dict(d['features'])
+    for m in analyzed_knp_info['morphemes']:
+        m[12] = dict(m[12])
+    return analyzed_knp_info
+
+# KNPの出力をEOSで区切って一文ずつ返す（ストリーム全体をメモリに載せない）
+def yield_knp_sentences(stream):
+    lines = []
+    for line in stream:
+        lines.append(line)
+        if line.rstrip('\n') == 'EOS':
+            yield ''.join(lines)
+            lines = []
+    if ''.join(lines).strip():
+        yield ''.join(lines)
+
+def convert_batch(knp_outputs, fmt):
+    if fmt == 'jsonl':
+        return ''.join(json.dumps(analyze_knp(o), ensure_ascii=False) + '\n'
+                       for o in knp_outputs).encode('utf-8')
+    else:
+        return b''.join(pickle.dumps(to_plain(analyze_knp(o)), pickle.HIGHEST_PROTOCOL)
+                        for o in knp_outputs)
+
+def count_and_convert_batch(knp_outputs, fmt):
+    return len(knp_outputs), convert_batch(knp_outputs, fmt)
+
+# pickle形式で書き出したファイルから一文ずつ読み出す
+# pickle.loadは任意のコードを実行しうるので、信頼できるファイル以外には使わないこと
+def load_knp_pickles(f):
+    while True:
+        try:
+            yield pickle.load(f)
+        except EOFError:
+            return
+
+def yield_batches(stream, batch_size):
+    batch = []
+    for knp_output in yield_knp_sentences(stream):
+        batch.append(knp_output)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+# 変換結果を入力の順に返す
+# 処理中のバッチはmax_in_flight個までしか持たないので、入力の大きさによらずメモリ使用量は一定
+def convert_stream(stream, fmt='jsonl', workers=0, batch_size=256, max_in_flight=None):
+    return ordered_bounded_map(count_and_convert_batch, yield_batches(stream, batch_size),
+                               workers, max_in_flight, (fmt,))
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='KNPの-tab出力をJSONL/pickle形式に変換する')
+    parser.add_argument('input', nargs='?', default='-', help='KNPの出力ファイル（省略時は標準入力）')
+    parser.add_argument('-o', '--output', default=None, help='出力先（省略時は標準出力）')
+    parser.add_argument('-f', '--format', choices=['jsonl', 'pickle'], default='jsonl',
+                        help='pickle形式の出力は信頼できる環境で作ったものだけを読み込むこと（読み込み時に任意のコードが実行されうる）')
+    parser.add_argument('-j', '--workers', type=int, default=0, help='ワーカープロセスの数（0ならこのプロセス内で変換）')
+    parser.add_argument('--batch-size', type=int, default=256, help='一度にワーカーに渡す文の数')
+    parser.add_argument('--max-in-flight', type=int, default=None, help='同時に処理中にしておくバッチの数')
+    parser.add_argument('-b', '--benchmark', action='store_true', help='出力を捨てて変換の速度を標準エラー出力に表示する')
+    args = parser.parse_args()
+    if args.benchmark and args.output is not None:
+        parser.error('-b/--benchmark discards the output and cannot be combined with -o/--output')
+
+    fin = sys.stdin if args.input == '-' else open(args.input, encoding='utf-8')
+    if args.benchmark:
+        fout = None
+    else:
+        fout = sys.stdout.buffer if args.output in (None, '-') else open(args.output, 'wb')
+
+    start = time.time()
+    n_sents, n_bytes = 0, 0
+    for n, data in convert_stream(fin, args.format, args.workers, args.batch_size, args.max_in_flight):
+        n_sents += n
+        n_bytes += len(data)
+        if fout:
+            fout.write(data)
+
+    if fout:
+        fout.flush()
+        if fout is not sys.stdout.buffer:
+            fout.close()
+    if fin is not sys.stdin:
+        fin.close()
+
+    if args.benchmark:
+        elapsed = time.time() - start
+        print('sentences: {0}'.format(n_sents), file=sys.stderr)
+        print('output: {0:.1f} MB'.format(n_bytes / 2**20), file=sys.stderr)
+        print('elapsed: {0:.2f} s'.format(elapsed), file=sys.stderr)
+        print('throughput: {0:.1f} sentences/s, {1:.2f} MB/s'.format(
+            n_sents / elapsed, n_bytes / 2**20 / elapsed), file=sys.stderr)
@@ -134,7 +134,7 @@ class Phrase():
     def __init__(self, linestr):
         self.basics = []
         
-        f = re.split('>?<?', linestr)
+        f = re.split('>?<|>', linestr)
         self.rel = int(f[0][2:-2])
         self.reltype = f[0][-2]   
         self.features = decode_features(f[1:-1])  # 最初は係り受けの情報、最後は空
@@ -147,7 +147,7 @@ class Basic():
         self.phrase = -1
         self.mrphs = []
 
-        f = re.split('>?<?', linestr)
+        f = re.split('>?<|>', linestr)
         self.rel = int(f[0][2:-2])
         self.reltype = f[0][-2]        
         self.features = decode_features(f[1:-1])
@@ -167,7 +167,7 @@ class Morpheme():
     def __init__(self, linestr):
         self.basic = -1
         
-        f = re.split('>?<?', linestr)
+        f = re.split('>?<|>', linestr)
         s = f[0].split(' ', 11)
 
         self.input = s[0]
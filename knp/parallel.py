@@ -0,0 +1,21 @@
+from collections import deque
+from multiprocessing import Pool
+
+# itemsの各要素にfuncを適用した結果を入力の順に返す
+# 処理中の要素はmax_in_flight個（既定ではworkersの2倍）までしか持たず、それを超えると入力を読み進めない
+# workersが0ならこのプロセス内で順に処理する
+def ordered_bounded_map(func, items, workers=0, max_in_flight=None, args=()):
+    if workers < 1:
+        for item in items:
+            yield func(item, *args)
+        return
+
+    max_in_flight = max_in_flight if max_in_flight else workers * 2
+    with Pool(workers) as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.apply_async(func, (item,) + tuple(args)))
+            while len(pending) >= max_in_flight:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
@@ -0,0 +1,27 @@
+# 原形などの文字列に小さい整数のidを振る
+# idはプロセス内でのみ有効（ワーカープロセスごとに別の語彙になる）
+# 語彙は消さないので、大きさはそれまでに見たopen classの原形の種類数に比例する
+# （print_pairs.pyでは候補文の転置索引のために、open classの原形にだけidを振る）
+
+class Vocabulary():
+    def __init__(self):
+        self.word_to_id = {}
+        self.words = []
+
+    def id(self, word):
+        i = self.word_to_id.get(word)
+        if i is None:
+            i = self.word_to_id[word] = len(self.words)
+            self.words.append(word)
+        return i
+
+    def ids(self, words):
+        return [self.id(w) for w in words]
+
+    def __getitem__(self, i):
+        return self.words[i]
+
+    def __len__(self):
+        return len(self.words)
+
+lemmas = Vocabulary()
@@ -0,0 +1,83 @@
+# print_pairs.pyの処理をプロセス内から呼び出すためのAPI
+#
+#     builder = CorpusPairBuilder(workers=4)
+#     for pair in builder.build(records):
+#         print(pair.title, pair.compressed)
+#
+# recordsには(title, text)のタプルか、<DOC>要素（ID, TITLE, TEXTを子に持つElement）を与える。
+from collections import namedtuple
+from knp.parallel import ordered_bounded_map
+from print_pairs import DEFAULT_CONFIG, grammarize_headline_and_sents, extract_sents, \
+                        preprocess_sentence, terminate_processes
+
+CompressionPair = namedtuple('CompressionPair', ['title', 'sentence', 'compressed', 'alignment', 'doc_id'])
+
+
+# recordを(doc_id, title, 先頭のk文)に変換する
+# DOC要素にIDがない場合やタプルの場合は入力中の位置をdoc_idとする
+def normalize_record(record, index, k=1):
+    if hasattr(record, 'find'):
+        id_elem = record.find('ID')
+        doc_id = id_elem.text if id_elem is not None else index
+        title, text = record.findtext('TITLE'), record.findtext('TEXT')
+    else:
+        doc_id = index
+        title, text = record
+    if not title or not text:
+        return None
+    sents = extract_sents(text, k)
+    if not sents:
+        return None
+    return doc_id, title, sents
+
+
+def process_batch(batch, config=DEFAULT_CONFIG):
+    pairs = []
+    for doc_id, title, sents in batch:
+        sents = [sent.lstrip().rstrip() for sent in sents]
+        result = grammarize_headline_and_sents(title, sents, config)
+        if result:
+            i, compressed, alignment = result
+            pairs.append(CompressionPair(title, preprocess_sentence(sents[i]), compressed, alignment, doc_id))
+    return pairs
+
+
+class CorpusPairBuilder():
+    # batch_size: 一度にワーカーに渡す記事の数
+    # max_in_flight: 同時に処理中にしておくバッチの数の上限（これを超えると入力を読み進めない、既定はworkersの2倍）
+    # workers: ワーカープロセスの数（0ならこのプロセス内で処理する）
+    def __init__(self, batch_size=64, max_in_flight=None, workers=0, config=DEFAULT_CONFIG):
+        if batch_size < 1:
+            raise ValueError('batch_size must be positive')
+        if config.candidate_sentences < 1:
+            raise ValueError('config.candidate_sentences must be positive')
+        self.batch_size = batch_size
+        self.workers = workers
+        self.max_in_flight = max_in_flight
+        self.config = config
+
+    def yield_batches(self, records):
+        batch = []
+        for index, record in enumerate(records):
+            normalized = normalize_record(record, index, self.config.candidate_sentences)
+            if normalized:
+                batch.append(normalized)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    # 入力の順序を保ったままCompressionPairを返すイテレータ
+    def build(self, records):
+        try:
+            for pairs in ordered_bounded_map(process_batch, self.yield_batches(records),
+                                             self.workers, self.max_in_flight, (self.config,)):
+                yield from pairs
+        finally:
+            # ワーカープロセスのJUMAN/KNPはワーカーの終了とともに終わる
+            if self.workers < 1:
+                terminate_processes()
+
+    def __call__(self, records):
+        return self.build(records)
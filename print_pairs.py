@@ -1,41 +1,102 @@
 #!/usr/bin/python3
 from subprocess import Popen, PIPE
-import sys, re, functools, pickle
+import sys, os, re, functools, pickle, json
 import xml.etree.ElementTree as ET
 from collections import defaultdict
 from knp.knp2json import analyze_knp
 from knp.knpinfo import decode_juman_info, preprocess_sentence, read_until_EOS
+from knp.vocab import lemmas
 
 class BadPairException(Exception):
     pass
 
-juman_prc = Popen("juman", stdin=PIPE, stdout=PIPE, universal_newlines=True)
-knp_prc = Popen(("knp", "-dpnd-fast", "-tab"), stdin=PIPE, stdout=PIPE, universal_newlines=True)
-with open('./katuyou.pickle', 'rb') as f:
+# ヒューリスティクスのパラメータ
+class HeuristicConfig():
+    def __init__(self, short_title_length=6, min_open_classes=4, context_window=2,
+                 comma_weight=0.1, suru_naru_cases=('ト', 'ニ', 'カラ'), candidate_sentences=1):
+        if candidate_sentences < 1:
+            raise ValueError('candidate_sentences must be positive')
+        self.short_title_length = short_title_length  # この形態素数以下のタイトルは使わない
+        self.min_open_classes = min_open_classes      # タイトル中に必要なopen classの数
+        self.context_window = context_window          # 周辺の形態素の一致を見る幅
+        self.comma_weight = comma_weight              # 周辺の形態素が「、」で一致したときの点数
+        self.suru_naru_cases = tuple(suru_naru_cases) # 「する」「なる」の場合に含める格
+        self.candidate_sentences = candidate_sentences  # タイトルと対応づける文を本文の先頭から何文まで探すか
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(**d)
+
+    def to_dict(self):
+        return {'short_title_length': self.short_title_length,
+                'min_open_classes': self.min_open_classes,
+                'context_window': self.context_window,
+                'comma_weight': self.comma_weight,
+                'suru_naru_cases': list(self.suru_naru_cases),
+                'candidate_sentences': self.candidate_sentences}
+
+    def __str__(self):
+        return json.dumps(self.to_dict(), ensure_ascii=False)
+
+DEFAULT_CONFIG = HeuristicConfig()
+
+JUMAN_COMMAND = ("juman",)
+KNP_COMMAND = ("knp", "-dpnd-fast", "-tab")
+_processes = {}
+
+# JUMAN/KNPのプロセスは最初に使うときに起動する
+# fork後の子プロセスでは親のパイプを共有しないように新しく起動する
+def get_process(command):
+    key = (os.getpid(), command)
+    if key not in _processes:
+        _processes[key] = Popen(command, stdin=PIPE, stdout=PIPE, universal_newlines=True)
+    return _processes[key]
+
+def terminate_processes():
+    for key in list(_processes):
+        if key[0] == os.getpid():
+            _processes.pop(key).terminate()
+
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'katuyou.pickle'), 'rb') as f:
     inflection_table = pickle.load(f)
 
-def yield_headline_and_1st_sent(filename):
-    title, text = '', ''
-    pattern = re.compile(r'([^。「」]*?「.*?」)*[^。「」]*?。') #日本語の1文にマッチする正規表現
+sent_pattern = re.compile(r'([^。「」]*?「.*?」)*[^。「」]*?。') #日本語の1文にマッチする正規表現
+
+# 記事本文から先頭のk文を抜き出す
+def extract_sents(text, k):
+    sents = []
+    for line in text.split('\n'):
+        for matchobj in sent_pattern.finditer(line):
+            sents.append(matchobj.group(0))
+            if len(sents) >= k:
+                return sents
+    return sents
+
+# 記事本文から最初の文を抜き出す
+def extract_1st_sent(text):
+    sents = extract_sents(text, 1)
+    return sents[0] if sents else ''
+
+def yield_headline_and_sents(filename, k):
+    title, sents = '', []
     
     for event, elem in ET.iterparse(filename):
         if elem.tag == 'TITLE':
             title = elem.text
         elif elem.tag == 'TEXT':
             if title and elem.text:
-                # elem.textから最初の文を抜き出す
-                for line in elem.text.split('\n'):
-                    matchobj = pattern.search(line)
-                    if matchobj:
-                        text = matchobj.group(0)
-                        break
-                if title and text:
-                    yield title, text
-            title, text = '', ''
+                sents = extract_sents(elem.text, k)
+                if title and sents:
+                    yield title, sents
+            title, sents = '', []
         elif elem.tag == 'DOC':
             continue
         elem.clear()
 
+def yield_headline_and_1st_sent(filename):
+    for title, sents in yield_headline_and_sents(filename, 1):
+        yield title, sents[0]
+
 # データが奇数行目 = タイトル, 偶数行目 = 一文目という形式で与えられたとき用
 # def yield_headline_and_1st_sent(filename):
 #     is_headline = True
@@ -57,6 +118,10 @@ def is_open_class(mrph):
 def extract_open_classes(morphemes):
     return [m[2] for m in morphemes if is_open_class(m)]
 
+# extract_open_classesの原形をidにしたもの
+def extract_open_class_ids(morphemes):
+    return [lemmas.id(m[2]) for m in morphemes if is_open_class(m)]
+
 
 def first_open_class(mrphs):
     for m in mrphs:
@@ -64,7 +129,7 @@ def first_open_class(mrphs):
             return m
     return None
 
-def mark_words_in_sent(sent_mrphs, title_mrphs, open_classes):
+def mark_words_in_sent(sent_mrphs, title_mrphs, open_classes, config=DEFAULT_CONFIG):
     marked_mrphs = []
     open_class_dict = {}
     # is_plural = False
@@ -86,13 +151,13 @@ def mark_words_in_sent(sent_mrphs, title_mrphs, open_classes):
 
             # 周辺の形態素の一致によるscore付け
             identity_count = 0
-            for o in range(-2, 3):
+            for o in range(-config.context_window, config.context_window + 1):
                 io, jo = i + o, j + o
                 if io < 0 or io >= len(title_mrphs) or \
                    jo < 0 or jo >= len(sent_mrphs):
                     continue
                 if title_mrphs[io][2] == sent_mrphs[jo][2]:
-                    identity_count += 1 if title_mrphs[io][2] != '、' else 0.1
+                    identity_count += 1 if title_mrphs[io][2] != '、' else config.comma_weight
                 else:
                     identity_count = 0
                 scores[(i,j)] = max(scores[(i,j)], identity_count - 1)
@@ -150,7 +215,7 @@ def is_no_predicates(basic_ids, basics):
 # 連結で
 # 述語で終わっている
 # 最小の木
-def get_minimal_basic_tree(basics, morphemes, oc_indices):
+def get_minimal_basic_tree(basics, morphemes, oc_indices, config=DEFAULT_CONFIG):
     necessary_basic_ids = set()
     for i in range(len(basics)):
         for j in basics[i]['morphemes']:
@@ -172,7 +237,7 @@ def get_minimal_basic_tree(basics, morphemes, oc_indices):
 
             # 「する」「なる」の場合には、格を含める
             if morphemes[basics[i]['morphemes'][0]][2] in ['する', 'なる']:
-                for case in ['ト', 'ニ', 'カラ']:
+                for case in config.suru_naru_cases:
                     try:
                         cooccurence[i].add(basics[i]['caseAnalysis'][case][-1]['#basics'])
                     except KeyError:
@@ -213,11 +278,11 @@ def get_minimal_basic_tree(basics, morphemes, oc_indices):
 # 後ろの助詞を取ってくる（活用も変える）
 # 「行う」「開く」を「で」におきかえる
 
-def compress_sentence(knp_info, title_mrphs, oc_pairs):
+def compress_sentence(knp_info, title_mrphs, oc_pairs, config=DEFAULT_CONFIG):
     ocs_in_title, ocs_in_sent = list(zip(*oc_pairs))
     phrases, basics, morphemes = knp_info['phrases'], knp_info['basics'], knp_info['morphemes']
 
-    compressed_basic_ids = get_minimal_basic_tree(basics, morphemes, ocs_in_sent)
+    compressed_basic_ids = get_minimal_basic_tree(basics, morphemes, ocs_in_sent, config)
 
     compressed_phrase_ids = set()
     for i in range(len(phrases)):
@@ -321,56 +386,121 @@ def compress_sentence(knp_info, title_mrphs, oc_pairs):
     return compressed, alignment
 
 
-def grammarize_headline(headline, sent):
-    juman_prc.stdin.write(preprocess_sentence(sent) + '\n')
-    sent_juman_output = read_until_EOS(juman_prc.stdout)
-    sent_morphemes = decode_juman_info(sent_juman_output)
-
-    sent_words = extract_open_classes(sent_morphemes)
-
-    headline = preprocess_sentence(headline)
-    titles = [s for t in headline.split('　') for s in t.split('ーー')]
-    while titles:
-        title = '　'.join(titles) + '\n'
-        juman_prc.stdin.write(preprocess_sentence(title))
-        title_juman_output = read_until_EOS(juman_prc.stdout)
-        title_morphemes = decode_juman_info(title_juman_output)
-        
-        if len(title_morphemes) <= 6:
+# 一つの記事に対するJUMAN/KNPの解析結果を保持する
+# 解析は必要になった時点で一度だけ行い、異なるHeuristicConfigの間で使い回す
+# sentsには本文の先頭からの候補文を与える
+class PairAnalysis():
+    def __init__(self, headline, sents):
+        juman_prc = get_process(JUMAN_COMMAND)
+        self.sents = sents
+        self.sent_juman_outputs = []
+        self.sent_oc_counts = []   # 候補文に含まれるopen classの種類数
+        self.lemma_index = {}      # open classの原形のid -> それを含む候補文の番号のビット列
+        for i, sent in enumerate(sents):
+            juman_prc.stdin.write(preprocess_sentence(sent) + '\n')
+            self.sent_juman_outputs.append(read_until_EOS(juman_prc.stdout))
+            oc_ids = set(extract_open_class_ids(decode_juman_info(self.sent_juman_outputs[-1])))
+            self.sent_oc_counts.append(len(oc_ids))
+            for w in oc_ids:
+                self.lemma_index[w] = self.lemma_index.get(w, 0) | 1 << i
+
+        headline = preprocess_sentence(headline)
+        self.titles = [s for t in headline.split('　') for s in t.split('ーー')]
+        self.title_morphemes_list = []
+        self.title_open_classes_list = []
+        self.title_oc_ids_list = []
+        self.knp_outputs = {}
+
+    # タイトルの後ろを一つずつ削りながらJUMANで解析し、何番目のタイトルかを返す
+    def yield_titles(self):
+        juman_prc = get_process(JUMAN_COMMAND)
+        for n in range(len(self.titles), 0, -1):
+            k = len(self.titles) - n
+            if k == len(self.title_morphemes_list):
+                title = '　'.join(self.titles[:n]) + '\n'
+                juman_prc.stdin.write(preprocess_sentence(title))
+                title_juman_output = read_until_EOS(juman_prc.stdout)
+                title_morphemes = decode_juman_info(title_juman_output)
+                self.title_morphemes_list.append(title_morphemes)
+                self.title_open_classes_list.append(extract_open_classes(title_morphemes))
+                self.title_oc_ids_list.append(lemmas.ids(self.title_open_classes_list[-1]))
+            yield k
+
+    # 先頭のk文のうち、タイトルのopen classを全て含む文を選ぶ
+    # 複数ある場合はタイトル以外のopen classが少ない文、さらに先頭に近い文を選ぶ
+    def select_sent(self, open_class_ids, k):
+        candidates = (1 << min(k, len(self.sents))) - 1
+        for oc in set(open_class_ids):
+            candidates &= self.lemma_index.get(oc, 0)
+            if not candidates:
+                return None
+        if not candidates:
+            return None
+        return min((i for i in range(len(self.sents)) if candidates >> i & 1),
+                   key=lambda i: (self.sent_oc_counts[i], i))
+
+    # compress_sentenceは形態素を書き換えるので、毎回KNPの出力から解析し直す
+    def knp_info(self, i):
+        if not i in self.knp_outputs:
+            knp_prc = get_process(KNP_COMMAND)
+            knp_prc.stdin.write(self.sent_juman_outputs[i])
+            self.knp_outputs[i] = read_until_EOS(knp_prc.stdout)
+        return analyze_knp(self.knp_outputs[i])
+
+
+# 選んだ候補文の番号と短縮文、アライメントを返す
+def grammarize_analysis(analysis, config=DEFAULT_CONFIG):
+    for k in analysis.yield_titles():
+        title_morphemes = analysis.title_morphemes_list[k]
+        if len(title_morphemes) <= config.short_title_length:
             return
 
-        open_classes = extract_open_classes(title_morphemes)
+        open_classes = analysis.title_open_classes_list[k]
         # TODO: 単語の順序も考える
-        if len(open_classes) >= 4 and set(open_classes).issubset(set(sent_words)):
-            knp_prc.stdin.write(sent_juman_output)
-            sent_knp_output = read_until_EOS(knp_prc.stdout)
-            knp_info = analyze_knp(sent_knp_output)
-            oc_pairs = mark_words_in_sent(knp_info['morphemes'], title_morphemes, open_classes)
+        if len(open_classes) >= config.min_open_classes:
+            i = analysis.select_sent(analysis.title_oc_ids_list[k], config.candidate_sentences)
+            if i is None:
+                continue
+            knp_info = analysis.knp_info(i)
+            oc_pairs = mark_words_in_sent(knp_info['morphemes'], title_morphemes, open_classes, config)
             try:
-                compressed, alignment = compress_sentence(knp_info, title_morphemes, oc_pairs)
+                compressed, alignment = compress_sentence(knp_info, title_morphemes, oc_pairs, config)
             except BadPairException:
                 return
-            return compressed, alignment
-        else:
-            titles = titles[:-1]
+            return i, compressed, alignment
+
+
+def grammarize_headline_and_sents(headline, sents, config=DEFAULT_CONFIG):
+    return grammarize_analysis(PairAnalysis(headline, sents), config)
+
+
+def grammarize_headline(headline, sent, config=DEFAULT_CONFIG):
+    result = grammarize_headline_and_sents(headline, [sent], config)
+    if result:
+        return result[1:]
+
+
+def print_pair(hline, sent, compressed, alignment, file=sys.stdout):
+    print(hline, file=file)
+    print(preprocess_sentence(sent), file=file)
+    print(compressed, file=file)
+    for i, j in alignment:
+        print(str(i) + '-' + str(j), end=' ', file=file)
+    print('\n', file=file)
 
 
 if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        print('usage: ./print_pairs.py xml-file-like-毎日新聞コーパス > file-to-store-pairs.txt', file=sys.stderr)
+    usage = 'usage: ./print_pairs.py xml-file-like-毎日新聞コーパス [候補文の数（1以上）] > file-to-store-pairs.txt'
+    if len(sys.argv) < 2 or len(sys.argv) > 2 and not (sys.argv[2].isdigit() and int(sys.argv[2]) >= 1):
+        print(usage, file=sys.stderr)
         sys.exit(1)
-    for hline, sent in yield_headline_and_1st_sent(sys.argv[1]):
-        sent = sent.lstrip().rstrip()
-        compressed_alignment = grammarize_headline(hline, sent)
-        if compressed_alignment:
-            compressed, alignment = compressed_alignment
-            print(hline)
-            print(preprocess_sentence(sent))
-            print(compressed)
-            for i, j in alignment:
-                print(str(i) + '-' + str(j), end=' ')
-            print('\n')
+    config = HeuristicConfig(candidate_sentences=int(sys.argv[2])) if len(sys.argv) > 2 else DEFAULT_CONFIG
+    for hline, sents in yield_headline_and_sents(sys.argv[1], config.candidate_sentences):
+        sents = [sent.lstrip().rstrip() for sent in sents]
+        result = grammarize_headline_and_sents(hline, sents, config)
+        if result:
+            i, compressed, alignment = result
+            print_pair(hline, sents[i], compressed, alignment)
             # sys.stdin.readline()
-    knp_prc.terminate()
-    juman_prc.terminate()
+    terminate_processes()
     sys.exit(0)
@@ -0,0 +1,54 @@
+#!/usr/bin/python3
+# 各記事を一度だけJUMAN/KNPで解析し、その結果を使い回して
+# 複数のHeuristicConfigでペアを作る（パラメータ調整用）
+import sys, os, json, itertools
+from print_pairs import HeuristicConfig, PairAnalysis, grammarize_analysis, \
+                        print_pair, yield_headline_and_sents, terminate_processes
+
+# {"context_window": [1, 2, 3], "min_open_classes": [3, 4]} のような形式の
+# グリッドから、全ての組み合わせのHeuristicConfigを作る
+def load_config_grid(filename):
+    with open(filename) as f:
+        grid = json.load(f)
+    keys = sorted(grid)
+    return [HeuristicConfig.from_dict(dict(zip(keys, values)))
+            for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def sweep(corpus, configs, out_dir):
+    os.makedirs(out_dir, exist_ok=True)
+    names = ['config{0:03d}'.format(i) for i in range(len(configs))]
+    outputs = [open(os.path.join(out_dir, name + '.txt'), 'w') for name in names]
+    pair_counts = [0] * len(configs)
+    doc_count = 0
+    max_sents = max(config.candidate_sentences for config in configs)
+
+    for hline, sents in yield_headline_and_sents(corpus, max_sents):
+        sents = [sent.lstrip().rstrip() for sent in sents]
+        analysis = PairAnalysis(hline, sents)
+        doc_count += 1
+        for k, config in enumerate(configs):
+            result = grammarize_analysis(analysis, config)
+            if result:
+                i, compressed, alignment = result
+                print_pair(hline, sents[i], compressed, alignment, file=outputs[k])
+                pair_counts[k] += 1
+
+    for f in outputs:
+        f.close()
+
+    with open(os.path.join(out_dir, 'stats.tsv'), 'w') as f:
+        print('name', 'documents', 'pairs', 'yield', 'config', sep='\t', file=f)
+        for name, config, count in zip(names, configs, pair_counts):
+            ratio = count / doc_count if doc_count else 0.0
+            print(name, doc_count, count, '{0:.4f}'.format(ratio), config, sep='\t', file=f)
+            print(name, count, '{0:.4f}'.format(ratio), config, sep='\t', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 4:
+        print('usage: ./sweep.py xml-file-like-毎日新聞コーパス config-grid.json output-dir', file=sys.stderr)
+        sys.exit(1)
+    sweep(sys.argv[1], load_config_grid(sys.argv[2]), sys.argv[3])
+    terminate_processes()
+    sys.exit(0)